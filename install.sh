@@ -27,8 +27,8 @@ if ! python3 -m pip install --upgrade pip --break-system-packages 2>/dev/null; t
     python3 -m pip install --upgrade pip
 fi
 
-if ! python3 -m pip install --upgrade slither-analyzer crytic-compile py-solc-x solc-select --break-system-packages 2>/dev/null; then
-    python3 -m pip install --upgrade slither-analyzer crytic-compile py-solc-x solc-select
+if ! python3 -m pip install --upgrade slither-analyzer crytic-compile py-solc-x solc-select aiohttp orjson --break-system-packages 2>/dev/null; then
+    python3 -m pip install --upgrade slither-analyzer crytic-compile py-solc-x solc-select aiohttp orjson
 fi
 
 # Ensure user local bin is in PATH for the current script execution
@@ -50,9 +50,12 @@ if [[ ! -f "$ROOT_DIR/scripts/install_all_solc.py" ]]; then
   exit 1
 fi
 
-read -r -p "Parallel workers (default: 4): " SOLC_WORKERS
-SOLC_WORKERS="${SOLC_WORKERS:-4}"
-if ! python3 "$ROOT_DIR/scripts/install_all_solc.py" --workers "$SOLC_WORKERS"; then
+read -r -p "Parallel workers (default: auto): " SOLC_WORKERS
+SOLC_ARGS=()
+if [[ -n "$SOLC_WORKERS" ]]; then
+  SOLC_ARGS=(--workers "$SOLC_WORKERS")
+fi
+if ! python3 "$ROOT_DIR/scripts/install_all_solc.py" ${SOLC_ARGS[@]+"${SOLC_ARGS[@]}"}; then
   printf "\nWarning: some solc versions failed to install; continuing.\n" >&2
 fi
 
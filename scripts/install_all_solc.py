@@ -1,9 +1,30 @@
 import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import re
 import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.dummy import Pool
 from shutil import which
 import subprocess
 
+try:
+    import aiohttp  # type: ignore
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+BINARIES_URL = "https://binaries.soliditylang.org"
+SOLCX_ENTRY_RE = re.compile(r"solc-v(\d+\.\d+\.\d+)$")
+SOLC_SELECT_VERSION_RE = re.compile(r"^\s*(\d+\.\d+\.\d+)", re.MULTILINE)
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 4) * 4)
+PROGRESS_BATCH = 8
+INSTALLABLE_CACHE_TTL = 24 * 60 * 60
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
@@ -33,13 +54,18 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--workers",
         type=int,
-        default=4,
-        help="Concurrent download workers (default: 4).",
+        default=DEFAULT_WORKERS,
+        help=f"Concurrent downloads (default: {DEFAULT_WORKERS}).",
     )
     parser.add_argument(
         "--dry-run",
         action="store_true",
-        help="Print the plan without installing anything.",
+        help="Print the plan as JSON without installing anything.",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore the cached installable version list (24h TTL).",
     )
     parser.add_argument(
         "--no-solc-select-fallback",
@@ -51,18 +77,15 @@ def parse_args() -> argparse.Namespace:
 
 def to_version_str(v) -> str:
     s = str(v).strip()
-    if s.startswith("v"):
-        return s[1:]
-    return s
+    return s[1:] if s[:1] == "v" else s
 
 
-def as_tuple(version_str: str) -> tuple[int, int, int]:
+def as_key(version_str: str) -> int:
     parts = version_str.split(".")
     parts = (parts + ["0", "0", "0"])[:3]
-    try:
-        return (int(parts[0]), int(parts[1]), int(parts[2]))
-    except ValueError:
-        return (0, 0, 0)
+    if not all(p.isdigit() for p in parts):
+        return 0
+    return (int(parts[0]) << 32) | (int(parts[1]) << 16) | int(parts[2])
 
 
 def normalize_only_major(only_major: str) -> str:
@@ -78,6 +101,46 @@ def normalize_only_major(only_major: str) -> str:
     return s
 
 
+def installable_cache_path() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "install_all_solc", "installable.json")
+
+
+def load_installable(solcx, refresh: bool) -> list[str]:
+    path = installable_cache_path()
+    if not refresh:
+        try:
+            if time.time() - os.path.getmtime(path) < INSTALLABLE_CACHE_TTL:
+                with open(path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    versions = [str(v) for v in solcx.get_installable_solc_versions()]
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(versions, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return versions
+
+
+def solcx_installed(install_folder: str) -> set[str]:
+    try:
+        with os.scandir(install_folder) as it:
+            return {
+                m.group(1)
+                for m in map(SOLCX_ENTRY_RE.match, (e.name for e in it))
+                if m
+            }
+    except OSError:
+        return set()
+
+
+@functools.lru_cache(maxsize=1)
 def has_solc_select() -> bool:
     return which("solc-select") is not None
 
@@ -90,35 +153,104 @@ def solc_select_installed() -> set[str]:
             ["solc-select", "versions"],
             check=False,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
             text=True,
         )
     except Exception:
         return set()
 
-    installed: set[str] = set()
-    for line in res.stdout.splitlines():
-        s = line.strip()
-        if not s:
-            continue
-        if " " in s:
-            s = s.split(" ", 1)[0].strip()
-        if s and s[0].isdigit():
-            installed.add(s)
-    return installed
+    return set(SOLC_SELECT_VERSION_RE.findall(res.stdout))
 
 
-def solc_select_install(version_str: str) -> bool:
-    if not has_solc_select():
-        return False
-    res = subprocess.run(
-        ["solc-select", "install", version_str],
+def _solc_select_install(versions: list[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        ["solc-select", "install", *versions],
         check=False,
-        stdout=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
         stderr=subprocess.PIPE,
         text=True,
     )
-    return res.returncode == 0
+
+
+def solc_select_install_many(versions: list[str]) -> set[str]:
+    if not versions or not has_solc_select():
+        return set()
+    before = solc_select_installed()
+    res = _solc_select_install(versions)
+    recovered = (solc_select_installed() - before) & set(versions)
+    if res.returncode == 0:
+        return recovered
+
+    # solc-select validates the whole batch up front, so one unavailable
+    # version aborts it; retry the rest one at a time.
+    for v in versions:
+        if v in recovered:
+            continue
+        res = _solc_select_install([v])
+        if res.returncode != 0 and res.stderr.strip():
+            sys.stderr.write(f"solc-select install {v}: {res.stderr.strip()}\n")
+    return (solc_select_installed() - before) & set(versions)
+
+
+def binaries_platform() -> str:
+    if sys.platform.startswith("linux"):
+        return "linux-amd64"
+    if sys.platform == "darwin":
+        return "macosx-amd64"
+    return ""
+
+
+async def fetch_binary(session, platform: str, filename: str, sha256: str,
+                       dest: str) -> None:
+    tmp = f"{dest}.part"
+    digest = hashlib.sha256()
+    try:
+        async with session.get(f"{BINARIES_URL}/{platform}/{filename}") as resp:
+            with open(tmp, "wb") as fw:
+                async for chunk in resp.content.iter_chunked(1 << 16):
+                    digest.update(chunk)
+                    fw.write(chunk)
+        if digest.hexdigest() != sha256:
+            raise ValueError(f"sha256 mismatch for {filename}")
+        os.chmod(tmp, 0o755)
+        os.replace(tmp, dest)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+async def fetch_all(plan: list[str], install_folder: str, platform: str,
+                    concurrency: int, report) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession(raise_for_status=True) as session:
+        async with session.get(f"{BINARIES_URL}/{platform}/list.json") as resp:
+            listing = await resp.json(content_type=None)
+        releases = listing.get("releases", {})
+        checksums = {
+            b.get("path"): b.get("sha256", "").lower().removeprefix("0x")
+            for b in listing.get("builds", [])
+        }
+
+        async def fetch_one(version_str: str):
+            filename = releases.get(version_str)
+            if not filename:
+                return version_str, f"no {platform} build available"
+            sha256 = checksums.get(filename)
+            if not sha256:
+                return version_str, f"no sha256 listed for {filename}"
+            dest = os.path.join(install_folder, f"solc-v{version_str}")
+            try:
+                async with semaphore:
+                    await fetch_binary(session, platform, filename, sha256, dest)
+            except Exception as e:
+                return version_str, str(e) or type(e).__name__
+            return version_str, None
+
+        for coro in asyncio.as_completed([fetch_one(v) for v in plan]):
+            report(*(await coro))
 
 
 def main() -> int:
@@ -136,41 +268,56 @@ def main() -> int:
     max_v = to_version_str(args.max_version)
     only_major_prefix = normalize_only_major(args.only_major)
 
-    installable = [
-        to_version_str(v)
-        for v in solcx.get_installable_solc_versions()
-    ]
-    installed = {
-        to_version_str(v)
-        for v in solcx.get_installed_solc_versions()
-    }
-    solc_select_have = solc_select_installed()
-
-    plan = []
-    for v in installable:
-        if only_major_prefix and not v.startswith(only_major_prefix):
-            continue
-        if min_v and as_tuple(v) < as_tuple(min_v):
+    install_folder = str(solcx.get_solcx_install_folder())
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        installable_f = executor.submit(load_installable, solcx, args.refresh)
+        installed_f = executor.submit(solcx_installed, install_folder)
+        solc_select_f = executor.submit(solc_select_installed)
+        installable = installable_f.result()
+        installed = installed_f.result()
+        solc_select_have = solc_select_f.result()
+
+    min_k = as_key(min_v) if min_v else None
+    max_k = as_key(max_v) if max_v else None
+
+    candidates = installable
+    if only_major_prefix:
+        if only_major_prefix.count(".") == 2 and only_major_prefix.endswith("."):
+            buckets: dict[str, list[str]] = {}
+            for v in installable:
+                buckets.setdefault(v.rsplit(".", 1)[0] + ".", []).append(v)
+            candidates = buckets.get(only_major_prefix, [])
+        else:
+            candidates = [v for v in installable if v.startswith(only_major_prefix)]
+
+    already = installed | solc_select_have
+    planned = []
+    for v, k in [(v, as_key(v)) for v in candidates]:
+        if min_k is not None and k < min_k:
             continue
-        if max_v and as_tuple(v) > as_tuple(max_v):
+        if max_k is not None and k > max_k:
             continue
-        if v in installed or v in solc_select_have:
+        if v in already:
             continue
-        plan.append(v)
+        planned.append((v, k))
 
-    plan.sort(key=as_tuple)
-
-    sys.stdout.write(f"Installable: {len(installable)}\n")
-    sys.stdout.write(f"Already installed: {len(installed)}\n")
-    sys.stdout.write(f"To install: {len(plan)}\n")
+    planned.sort(key=lambda x: x[1])
+    plan = [v for v, _ in planned]
 
     if args.dry_run:
-        if plan:
-            sys.stdout.write("Planned versions:\n")
-            for v in plan:
-                sys.stdout.write(f"  {v}\n")
+        sys.stdout.write(json.dumps({
+            "installable": len(installable),
+            "installed": len(installed),
+            "plan": plan,
+        }) + "\n")
         return 0
 
+    sys.stdout.write(
+        f"Installable: {len(installable)}\n"
+        f"Already installed: {len(installed)}\n"
+        f"To install: {len(plan)}\n"
+    )
+
     if not plan:
         return 0
 
@@ -179,29 +326,62 @@ def main() -> int:
 
     allow_fallback = (not args.no_solc_select_fallback) and has_solc_select()
 
-    def install_one(version_str: str) -> None:
+    done = 0
+    total = len(plan)
+    progress: list[str] = []
+
+    def flush_progress() -> None:
+        if progress:
+            sys.stdout.write("".join(progress))
+            sys.stdout.flush()
+            progress.clear()
+
+    def report(v: str, err) -> None:
+        nonlocal done
+        if err is None:
+            done += 1
+            progress.append(f"[{done}/{total}] installed {v}\n")
+            if len(progress) >= PROGRESS_BATCH or done == total:
+                flush_progress()
+            return
+        failures.append((v, str(err)))
+        if not allow_fallback:
+            sys.stderr.write(f"[FAIL] {v}: {err}\n")
+
+    def install_one(version_str: str):
         try:
             solcx.install_solc(f"v{version_str}")
-        except Exception:
-            if not allow_fallback:
-                raise
-            ok = solc_select_install(version_str)
-            if not ok:
-                raise
-
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        futures = {executor.submit(install_one, v): v for v in plan}
-        done = 0
-        total = len(plan)
-        for f in as_completed(futures):
-            v = futures[f]
-            try:
-                f.result()
+        except Exception as e:
+            return version_str, e
+        return version_str, None
+
+    fetched = False
+    platform = binaries_platform()
+    if AIOHTTP_AVAILABLE and platform:
+        try:
+            asyncio.run(
+                fetch_all(plan, install_folder, platform, workers, report)
+            )
+            fetched = True
+        except Exception as e:
+            sys.stderr.write(f"Direct download unavailable, using solcx: {e}\n")
+
+    if not fetched:
+        with Pool(workers) as pool:
+            for v, err in pool.imap_unordered(install_one, plan):
+                report(v, err)
+    flush_progress()
+
+    if failures and allow_fallback:
+        recovered = solc_select_install_many([v for v, _ in failures])
+        for v, msg in failures:
+            if v in recovered:
                 done += 1
-                sys.stdout.write(f"[{done}/{total}] installed {v}\n")
-            except Exception as e:
-                failures.append((v, str(e)))
-                sys.stderr.write(f"[FAIL] {v}: {e}\n")
+                progress.append(f"[{done}/{total}] installed {v} (solc-select)\n")
+            else:
+                sys.stderr.write(f"[FAIL] {v}: {msg}\n")
+        flush_progress()
+        failures = [(v, msg) for v, msg in failures if v not in recovered]
 
     if failures:
         sys.stderr.write(f"Failed: {len(failures)}\n")
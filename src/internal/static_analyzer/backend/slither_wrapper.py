@@ -12,9 +12,18 @@ import json
 import sys
 import tempfile
 import os
+import time
+import hashlib
 import subprocess
 import re
 import shutil
+import stat
+import functools
+import importlib
+import inspect
+import pkgutil
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from shutil import which
 
 try:
@@ -37,15 +46,202 @@ try:
 except ImportError:
     SOLCX_AVAILABLE = False
 
-# 版本缓存，避免重复获取路径
-_VERSION_CACHE = {}
-_CURRENT_SOLC_SELECT_VERSION = None
+# 尝试导入 orjson（可选，解析大体积 JSON 更快）
+try:
+    import orjson
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+except ImportError:
+    _json_loads = json.loads
 
+    def _json_dumps(obj):
+        return (json.dumps(obj, separators=(',', ':')) + '\n').encode()
 
-def remove_duplicate_interfaces(code):
-    pattern = re.compile(
-        r'\binterface\s+([A-Za-z_][A-Za-z0-9_]*)\s*\{'
+
+def _write_json(obj):
+    """把响应 JSON（紧凑格式，Go 端整体解析 stdout）以 bytes 直接写到 stdout"""
+    sys.stdout.buffer.write(_json_dumps(obj))
+    sys.stdout.buffer.flush()
+
+# solc-select 版本 -> solc 路径缓存（版本通过 SOLC_VERSION 环境变量选择，路径本身不变）
+_SOLC_SELECT_PATH_CACHE = {}
+# solc-select 已安装版本集合（直接读取 artifacts 目录，None 表示尚未扫描）
+_SOLC_SELECT_VERSIONS = None
+# solcx 已安装版本集合与安装目录（None 表示尚未获取）
+_INSTALLED_SOLCX_VERSIONS = None
+_SOLCX_INSTALL_FOLDER = None
+
+# Slither 分析结果缓存（按源码内容、编译参数和 Slither 版本寻址）
+# 放在当前用户自己的缓存目录下（0700），避免共享 /tmp 中被其他用户抢先创建并投放结果
+_RESULT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'vespera', 'slither'
+)
+_RESULT_CACHE_TTL = 24 * 60 * 60
+
+# 不上报的低风险检测结果（impact 小写）
+_LOW_IMPACTS = frozenset({'low', 'informational', 'optimization'})
+
+# 预编译的正则表达式
+# pragma solidity 语句中的第一个完整版本号（如 ^0.8.19 -> 0.8.19）
+_PRAGMA_VERSION_RE = re.compile(r"pragma\s+solidity\s+[^;]*?(\d+\.\d+\.\d+)", re.IGNORECASE)
+# 注释与字符串字面量（字符串需要整体跳过，避免把 "https://..." 当作注释）
+_COMMENT_OR_STRING_RE = re.compile(
+    r'//[^\n]*|/\*[\s\S]*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+)
+# 选择主合约时排除的依赖库/接口/测试路径（大小写不敏感）
+_EXCLUDED_SOURCE_PATTERNS = (
+    'node_modules/', 'lib/', '@openzeppelin/', '@chainlink/', 'forge-std/',
+    'erc721a/', 'erc20/', 'erc1155/', 'erc777/',  # 常见的标准库
+    'contracts/interfaces/', 'interfaces/',  # 接口文件夹
+    '/test/', '/tests/', '/mock/', '/mocks/',  # 测试文件
+)
+_EXCLUDED_SOURCE_RE = re.compile(
+    '|'.join(map(re.escape, _EXCLUDED_SOURCE_PATTERNS)), re.IGNORECASE
+)
+_INTERFACE_RE = re.compile(r'\binterface\s+([A-Za-z_][A-Za-z0-9_]*)\s*\{')
+# solc-select artifacts 目录中的版本目录名（solc-0.8.19）
+_SOLC_SELECT_ARTIFACT_RE = re.compile(r'solc-(\d+\.\d+\.\d+)')
+# 编译错误 -> 友好提示（按顺序取第一条命中的规则；前瞻断言要求关键字同时出现，不限先后）
+_DIAG_RULES = (
+    (
+        re.compile(r'(?=[\s\S]*constructor\(\))(?=[\s\S]*Expected identifier)'),
+        "\n提示: Solidity 0.4.x 不支持 constructor() 语法。"
+        "0.4.x 使用与合约同名的函数作为构造函数。"
+        "这可能是合约代码本身的问题，而不是工具问题。",
+    ),
+    (
+        re.compile(r'(?=[\s\S]*emit)(?=[\s\S]*Expected token Semicolon)'),
+        "\n提示: emit 关键字在 Solidity 0.4.21 之前不存在。"
+        "这可能是合约代码本身的问题，而不是工具问题。",
+    ),
+    (
+        re.compile(r'(?=[\s\S]*Invalid compilation)'),
+        "\n提示: 合约代码可能包含与 Solidity {version} 不兼容的语法。"
+        "这可能是合约代码本身的问题，而不是工具问题。",
+    ),
+)
+
+
+def _strip_solidity_comments(src):
+    """单遍扫描删除 // 和 /* */ 注释，保留字符串字面量中的内容"""
+    parts = []
+    last = 0
+    for m in _COMMENT_OR_STRING_RE.finditer(src):
+        if src[m.start()] == '/':
+            parts.append(src[last:m.start()])
+            last = m.end()
+    parts.append(src[last:])
+    return ''.join(parts)
+
+
+def _normalize_source_path(rel_path):
+    """规范化 Etherscan sources 中的相对路径"""
+    rel = rel_path.lstrip("./").strip()
+    if not rel.endswith(".sol"):
+        # 给没有后缀的补 .sol，避免异常
+        rel = rel + ".sol"
+    return rel
+
+
+def _write_one(rel_path, meta, base_dir):
+    """写入单个源文件（统一行结尾），父目录需已创建"""
+    content = meta.get("content", "")
+    with open(os.path.join(base_dir, rel_path), "w", encoding="utf-8") as fw:
+        fw.write(content.replace("\r\n", "\n"))
+
+
+def _write_sources(sources, base_dir):
+    """将多文件 sources 并发写入 base_dir（保持原目录结构），返回相对路径列表"""
+    rel_paths = [_normalize_source_path(p) for p in sources]
+    # 先串行创建去重后的父目录（由浅到深，深层目录只需创建最后一级），避免并发 makedirs 竞争
+    dirs = {os.path.dirname(os.path.join(base_dir, rel)) for rel in rel_paths}
+    for d in sorted(dirs, key=lambda d: d.count(os.sep)):
+        os.makedirs(d, exist_ok=True)
+    items = list(zip(rel_paths, sources.values()))
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        list(ex.map(lambda kv: _write_one(kv[0], kv[1], base_dir), items))
+    return rel_paths
+
+
+def _slither_version():
+    """获取已安装的 slither-analyzer 版本（检测器集合随版本变化）"""
+    try:
+        from importlib.metadata import version
+        return version('slither-analyzer')
+    except Exception:
+        return 'unknown'
+
+
+def _result_cache_dir():
+    """返回可用的缓存目录；目录不是当前用户所有的真实目录时返回 None（不使用缓存）"""
+    try:
+        os.makedirs(_RESULT_CACHE_DIR, mode=0o700, exist_ok=True)
+        st = os.lstat(_RESULT_CACHE_DIR)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+            print(f"[DEBUG] 缓存目录不是当前用户所有的目录，跳过缓存: {_RESULT_CACHE_DIR}", file=sys.stderr)
+            return None
+        if st.st_mode & 0o077:
+            os.chmod(_RESULT_CACHE_DIR, 0o700)
+    except OSError:
+        return None
+    return _RESULT_CACHE_DIR
+
+
+def _result_cache_path(target_path, solc_version, solc_args):
+    """计算分析结果缓存路径，缓存目录不可用时不缓存"""
+    cache_dir = _result_cache_dir()
+    if cache_dir is None:
+        return None
+    h = hashlib.sha256()
+    for part in (solc_version or '', solc_args, _slither_version()):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    with open(target_path, 'rb') as f:
+        h.update(f.read())
+    return os.path.join(cache_dir, h.hexdigest() + '.json')
+
+
+def _load_cached_result(cache_path):
+    """读取未过期的缓存结果，不存在或损坏时返回 None"""
+    try:
+        if time.time() - os.path.getmtime(cache_path) > _RESULT_CACHE_TTL:
+            return None
+        with open(cache_path, 'rb') as f:
+            return _json_loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _store_cached_result(cache_path, result):
+    """原子写入缓存结果（先写临时文件再 os.replace），失败时忽略"""
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+
+def _render_foundry_toml(profile):
+    """把 [profile.default] 配置字典渲染为 foundry.toml 文本"""
+    def _value(v):
+        if isinstance(v, bool):
+            return 'true' if v else 'false'
+        if isinstance(v, (int, float)):
+            return str(v)
+        # 字符串和字符串列表的 JSON 表示同样是合法的 TOML
+        return json.dumps(v)
+
+    return '[profile.default]\n' + ''.join(
+        f'{k} = {_value(v)}\n' for k, v in profile.items()
     )
+
+
+def remove_duplicate_interfaces(code):
+    pattern = _INTERFACE_RE
     seen = set()
     i = 0
     out = []
@@ -83,6 +279,41 @@ def remove_duplicate_interfaces(code):
     return ''.join(out)
 
 
+def _get_solcx_install_folder():
+    """获取 solcx 安装目录（带缓存）"""
+    global _SOLCX_INSTALL_FOLDER
+
+    if _SOLCX_INSTALL_FOLDER is None:
+        _SOLCX_INSTALL_FOLDER = str(solcx.get_solcx_install_folder())
+    return _SOLCX_INSTALL_FOLDER
+
+
+def _get_installed_solcx():
+    """获取 solcx 已安装版本集合（不带 v 前缀，带缓存，安装成功后增量更新）"""
+    global _INSTALLED_SOLCX_VERSIONS
+
+    if _INSTALLED_SOLCX_VERSIONS is None:
+        _INSTALLED_SOLCX_VERSIONS = {
+            str(v).lstrip('v') for v in solcx.get_installed_solc_versions()
+        }
+    return _INSTALLED_SOLCX_VERSIONS
+
+
+def _find_solcx_binary(version_normalized):
+    """在 solcx 安装目录中查找指定版本的可执行文件"""
+    install_folder = _get_solcx_install_folder()
+    # solcx 没有 get_executable，需要手动构建路径，尝试不同的路径格式
+    possible_paths = [
+        os.path.join(install_folder, f"solc-v{version_normalized}"),
+        os.path.join(install_folder, f"solc-v{version_normalized}", "solc"),
+        os.path.join(install_folder, f"solc-{version_normalized}"),
+    ]
+    for path in possible_paths:
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
 def install_solc_version(version):
     """使用 solcx 安装 Solidity 版本（如果未安装）"""
     if not version or not SOLCX_AVAILABLE:
@@ -94,68 +325,61 @@ def install_solc_version(version):
         version_str = f'v{version_normalized}'  # solcx.install_solc 需要 v 前缀
         
         # 检查版本是否已安装
-        installed_versions = solcx.get_installed_solc_versions()
-        install_folder = solcx.get_solcx_install_folder()
-        for installed_version in installed_versions:
-            installed_str = str(installed_version).lstrip('v')
-            if installed_str == version_normalized:
-                # 版本已安装，构建路径
-                possible_paths = [
-                    os.path.join(install_folder, f"solc-v{installed_str}"),
-                    os.path.join(install_folder, f"solc-v{installed_str}", "solc"),
-                    os.path.join(install_folder, f"solc-{installed_str}"),
-                ]
-                for path in possible_paths:
-                    if os.path.exists(path) and os.access(path, os.X_OK):
-                        return path
-                return None
+        if version_normalized in _get_installed_solcx():
+            return _find_solcx_binary(version_normalized)
 
         # 版本未安装，尝试安装
         print(f"Installing solc {version_normalized}...", file=sys.stderr)
         solcx.install_solc(version_str)
-        # 安装后再次查找
-        installed_versions = solcx.get_installed_solc_versions()
-        install_folder = solcx.get_solcx_install_folder()
-        for installed_version in installed_versions:
-            installed_str = str(installed_version).lstrip('v')
-            if installed_str == version_normalized:
-                # 构建路径
-                possible_paths = [
-                    os.path.join(install_folder, f"solc-v{installed_str}"),
-                    os.path.join(install_folder, f"solc-v{installed_str}", "solc"),
-                    os.path.join(install_folder, f"solc-{installed_str}"),
-                ]
-                for path in possible_paths:
-                    if os.path.exists(path) and os.access(path, os.X_OK):
-                        return path
-        return None
+        # 安装成功，更新缓存而不是重新扫描
+        _get_installed_solcx().add(version_normalized)
+        return _find_solcx_binary(version_normalized)
     except Exception as e:
         print(f"Warning: solcx install failed: {e}", file=sys.stderr)
         # 如果 solcx 安装失败，尝试使用 solc-select
         return try_solc_select(version)
 
 
+def _list_solc_select_versions():
+    """读取 solc-select 的 artifacts 目录获取已安装版本（带缓存，避免启动子进程）"""
+    global _SOLC_SELECT_VERSIONS
+
+    if _SOLC_SELECT_VERSIONS is None:
+        # solc-select 在虚拟环境中会把数据放在 $VIRTUAL_ENV/.solc-select
+        home = os.environ.get('VIRTUAL_ENV') or os.path.expanduser('~')
+        artifacts_dir = os.path.join(home, '.solc-select', 'artifacts')
+        try:
+            entries = os.listdir(artifacts_dir)
+        except OSError:
+            entries = []
+        _SOLC_SELECT_VERSIONS = {
+            m.group(1) for m in map(_SOLC_SELECT_ARTIFACT_RE.fullmatch, entries) if m
+        }
+    return _SOLC_SELECT_VERSIONS
+
+
 def try_solc_select(version):
-    """尝试使用 solc-select 安装和切换版本"""
-    global _CURRENT_SOLC_SELECT_VERSION
+    """尝试使用 solc-select 安装版本
+
+    不再调用 solc-select use 切换全局软链接（并发分析时会互相干扰），
+    调用方需在子进程环境中设置 SOLC_VERSION 来选择版本。
+    """
+    global _SOLC_SELECT_VERSIONS
 
     if not version:
         return None
 
+    # 该版本已就绪且路径已知，直接返回
+    if version in _SOLC_SELECT_PATH_CACHE:
+        return _SOLC_SELECT_PATH_CACHE[version]
+
     try:
         # 检查 solc-select 是否可用
         if not which('solc-select'):
             return None
 
         # 检查版本是否已安装
-        list_result = subprocess.run(
-            ['solc-select', 'versions'],
-            capture_output=True, text=True, timeout=10
-        )
-        version_installed = False
-        if list_result.returncode == 0:
-            installed_versions = list_result.stdout.strip().split('\n')
-            version_installed = version in installed_versions
+        version_installed = version in _list_solc_select_versions()
 
         # 如果未安装，尝试安装版本
         if not version_installed:
@@ -163,79 +387,47 @@ def try_solc_select(version):
                 ['solc-select', 'install', version],
                 capture_output=True, text=True, timeout=60
             )
-            if install_result.returncode != 0:
-                # 安装失败，但继续尝试切换（可能已经安装了）
-                pass
-
-        # 只在版本不同时才切换（优化性能）
-        if _CURRENT_SOLC_SELECT_VERSION != version:
-            use_result = subprocess.run(
-                ['solc-select', 'use', version],
-                capture_output=True, text=True, timeout=10
-            )
-
-            if use_result.returncode == 0:
-                _CURRENT_SOLC_SELECT_VERSION = version
-                # 调试信息输出到 stderr，不会影响 JSON 输出
-                print(f"[DEBUG] Switched to solc {version}", file=sys.stderr)
+            if install_result.returncode == 0:
+                # 安装成功后重新扫描 artifacts 目录
+                _SOLC_SELECT_VERSIONS = None
             else:
                 return None
 
         # 返回 solc 路径
-        result = subprocess.run(
-            ['which', 'solc'],
-            capture_output=True, text=True, timeout=5
-        )
-        if result.returncode == 0:
-            return result.stdout.strip()
-
-        return None
+        path = which('solc')
+        if path:
+            _SOLC_SELECT_PATH_CACHE[version] = path
+        return path
     except (subprocess.TimeoutExpired, FileNotFoundError,
             subprocess.SubprocessError):
         return None
 
 
+@functools.lru_cache(maxsize=128)
 def get_solc_path(version):
-    """获取 solc 编译器路径（带缓存）"""
+    """获取 solc 编译器路径（进程内缓存，已安装的 solc 不会在运行中消失）
+
+    部署时可通过 SOLC_PATH_<版本号>（如 SOLC_PATH_0_8_19）直接指定路径，跳过查找与安装。
+    """
     if not version:
         return None
 
-    # 检查缓存
-    if version in _VERSION_CACHE:
-        cached_path = _VERSION_CACHE[version]
-        # 验证路径是否仍然有效
-        if cached_path and os.path.exists(cached_path):
-            return cached_path
+    override = os.environ.get('SOLC_PATH_' + version.lstrip('v').replace('.', '_'))
+    if override and os.path.exists(override):
+        return override
 
     solc_path = None
 
     # 方法1: 使用 solcx（如果可用，推荐，不需要全局切换）
     if SOLCX_AVAILABLE:
         try:
-            installed_versions = solcx.get_installed_solc_versions()
-            
             # 标准化版本格式：移除 v 前缀（solcx 使用不带 v 的格式）
             version_normalized = version.lstrip('v') if version.startswith('v') else version
-            
-            # 查找匹配的版本（solcx 返回的版本对象需要转换为字符串比较）
-            for installed_version in installed_versions:
-                installed_str = str(installed_version)
-                # 移除可能的 v 前缀进行比较
-                installed_normalized = installed_str.lstrip('v')
-                
-                if installed_normalized == version_normalized:
-                    # solcx 没有 get_executable，需要手动构建路径
-                    install_folder = solcx.get_solcx_install_folder()
-                    # 尝试不同的路径格式
-                    possible_paths = [
-                        os.path.join(install_folder, f"solc-v{installed_str}"),
-                        os.path.join(install_folder, f"solc-v{installed_str}", "solc"),
-                        os.path.join(install_folder, f"solc-{installed_str}"),
-                    ]
-                    for path in possible_paths:
-                        if os.path.exists(path) and os.access(path, os.X_OK):
-                            _VERSION_CACHE[version] = path
-                            return path
+
+            if version_normalized in _get_installed_solcx():
+                path = _find_solcx_binary(version_normalized)
+                if path:
+                    return path
         except Exception as e:
             print(f"Warning: solcx error: {e}", file=sys.stderr)
             pass
@@ -244,29 +436,116 @@ def get_solc_path(version):
     if not solc_path:
         solc_path = install_solc_version(version)
         if solc_path and os.path.exists(solc_path):
-            _VERSION_CACHE[version] = solc_path
             return solc_path
 
-    # 方法3: 使用 solc-select（需要全局切换）
+    # 方法3: 使用 solc-select（通过 SOLC_VERSION 环境变量选择版本）
     if not solc_path:
         solc_path = try_solc_select(version)
         if solc_path and os.path.exists(solc_path):
-            _VERSION_CACHE[version] = solc_path
             return solc_path
 
     return None
 
 
+@functools.lru_cache(maxsize=1)
+def _detector_classes():
+    """遍历 slither.detectors 下的所有子模块，收集检测器类（每个进程只扫描一次）"""
+    import slither.detectors as detectors_module
+
+    seen = set()
+    for module_info in pkgutil.walk_packages(
+        detectors_module.__path__, detectors_module.__name__ + '.', onerror=lambda _: None
+    ):
+        try:
+            mod = importlib.import_module(module_info.name)
+        except Exception:
+            continue
+        for _, obj in inspect.getmembers(mod, inspect.isclass):
+            # 只保留具体检测器（抽象基类的 ARGUMENT 为空）
+            if hasattr(obj, 'detect') and getattr(obj, 'ARGUMENT', None):
+                seen.add(obj)
+    return tuple(sorted(seen, key=lambda cls: (cls.ARGUMENT, cls.__module__, cls.__qualname__)))
+
+
+def _classification_text(value):
+    """Slither 的 DetectorClassification 枚举取枚举名（HIGH -> High），其他值直接转字符串
+
+    枚举的 str() 是 "DetectorClassification.HIGH"，既不便阅读，也匹配不上 _LOW_IMPACTS。
+    """
+    name = getattr(value, 'name', None)
+    return name.capitalize() if isinstance(name, str) else str(value)
+
+
+def _finding_line_numbers(finding):
+    """提取检测结果涉及的所有行号（去重并排序）
+
+    source_mapping 在旧版 Slither 中是 dict，新版中是带 lines 属性的 Source 对象。
+    """
+    _getattr = getattr
+    return sorted({
+        line
+        for element in _getattr(finding, 'elements', None) or ()
+        for source_mapping in (_getattr(element, 'source_mapping', None),)
+        if source_mapping
+        for line in (
+            source_mapping.get('lines') if isinstance(source_mapping, dict)
+            else _getattr(source_mapping, 'lines', None)
+        ) or ()
+    })
+
+
+def _detector_result_findings(detector_results):
+    """把检测器输出的 JSON 结果（Slither 的 detect() / 命令行 --json 格式）转换为上报条目"""
+    findings = []
+    for detector_data in detector_results:
+        impact = detector_data.get('impact', 'Unknown')
+
+        # 过滤低风险漏洞 (Low/Informational)
+        if impact.lower() in _LOW_IMPACTS:
+            continue
+
+        # 提取行号 (从 elements 中)
+        line_numbers = sorted({
+            line
+            for element in detector_data.get('elements', [])
+            for line in element.get('source_mapping', {}).get('lines', [])
+        })
+
+        findings.append({
+            'check': detector_data.get('check', 'unknown'),
+            'impact': impact,
+            'confidence': detector_data.get('confidence', 'Unknown'),
+            'description': detector_data.get('description', ''),
+            'line_numbers': line_numbers
+        })
+    return findings
+
+
+def _export_compilation(crytic_compile, archive_dir):
+    """把编译结果导出为 crytic-compile 归档，失败时返回 None
+
+    归档中包含编译产物和源码，slither 命令行加载它时不会再调用 solc。
+    """
+    try:
+        from crytic_compile.utils.zip import save_to_zip
+        archive_path = os.path.join(archive_dir, 'compilation.zip')
+        save_to_zip([crytic_compile], archive_path, zip_type='stored')
+        return archive_path
+    except Exception as e:
+        print(f"[DEBUG] 导出编译归档失败: {e}", file=sys.stderr)
+        return None
+
+
 def analyze_contract(code, config):
     """分析合约代码"""
     # 根据输入自动判断是单文件源码还是 Etherscan 多文件 JSON
     temp_file = None
-    temp_dir = None
     foundry_dir = None
+    archive_dir = None
+    crytic_compile = None
 
     # 从 config 中获取合约地址，用于命名扁平化文件
     import uuid
-    import time
     contract_address = config.get('address')
     if not contract_address:
         # 如果没有地址，生成一个随机文件名
@@ -278,16 +557,25 @@ def analyze_contract(code, config):
                 os.unlink(temp_file)
             except Exception:
                 pass
-        if temp_dir and os.path.exists(temp_dir):
-            try:
-                shutil.rmtree(temp_dir)
-            except Exception:
-                pass
         if foundry_dir and os.path.exists(foundry_dir):
             try:
                 shutil.rmtree(foundry_dir)
             except Exception:
                 pass
+        if archive_dir:
+            shutil.rmtree(archive_dir, ignore_errors=True)
+
+    def _compilation_archive():
+        # 成功编译后按需导出一次，供命令行回退使用，避免重复调用 solc
+        nonlocal archive_dir
+        if crytic_compile is None:
+            return None
+        if archive_dir is None:
+            archive_dir = tempfile.mkdtemp(prefix='slither_compilation_')
+        archive_path = os.path.join(archive_dir, 'compilation.zip')
+        if os.path.exists(archive_path):
+            return archive_path
+        return _export_compilation(crytic_compile, archive_dir)
 
     try:
         # 获取 Solidity 版本（来自上游 Go 端的推断）
@@ -300,13 +588,15 @@ def analyze_contract(code, config):
         if isinstance(code, str) and code.strip().startswith("{"):
             parsed = None
             raw = code.strip()
-            # 有些 Etherscan 返回会外层再包一层字符串或带多余括号，尽量容错解析
-            for candidate in (raw, raw[1:-1] if (raw.startswith("{") and raw.endswith("}")) else raw):
-                try:
-                    parsed = json.loads(candidate)
-                    break
-                except Exception:
-                    continue
+            # 有些 Etherscan 返回会外层再多包一层花括号（{{ ... }}），仅在首次解析失败时才剥离重试
+            try:
+                parsed = _json_loads(raw)
+            except json.JSONDecodeError:
+                if raw.startswith("{{") and raw.endswith("}}"):
+                    try:
+                        parsed = _json_loads(raw[1:-1])
+                    except json.JSONDecodeError:
+                        pass
             # Etherscan 两种常见结构：{"sources": {...}} 或 直接 {<path>: {"content": "..."}}
             if isinstance(parsed, dict):
                 if "sources" in parsed and isinstance(parsed["sources"], dict):
@@ -319,43 +609,16 @@ def analyze_contract(code, config):
                     if all(isinstance(v, dict) and "content" in v for v in parsed.values()):
                         sources = parsed
 
-        # 如果有多文件 sources，写入临时目录
+        # 如果有多文件 sources，交给 Forge 扁平化（源码只写入 foundry 工程目录一次）
         if sources:
-            temp_dir = tempfile.mkdtemp(prefix="slither_multi_")
-            for rel_path, meta in sources.items():
-                rel_path = rel_path.lstrip("./").strip()
-                if not rel_path.endswith(".sol"):
-                    # 给没有后缀的补 .sol，避免异常
-                    rel_path = rel_path + ".sol"
-                abs_path = os.path.join(temp_dir, rel_path)
-                os.makedirs(os.path.dirname(abs_path), exist_ok=True)
-                content = meta.get("content", "")
-                # 统一行结尾
-                content = content.replace("\r\n", "\n")
-                with open(abs_path, "w", encoding="utf-8") as fw:
-                    fw.write(content)
-            target_path = temp_dir
-
             # 如果 Go 端没有传版本，尝试在所有 sources 中提取 pragma 版本
             if not solc_version:
-                version_re = re.compile(r"pragma\s+solidity\s+([^;]+);", re.IGNORECASE)
-                version_full = re.compile(r"(\d+\.\d+\.\d+)")
-                detected = []
-                for rel_path, meta in sources.items():
-                    content = meta.get("content", "")
-                    m = version_re.search(content)
-                    if not m:
-                        continue
-                    vseg = m.group(1)
-                    m2 = version_full.search(vseg)
-                    if m2:
-                        detected.append(m2.group(1))
+                # 拼接所有源码后一次性匹配，避免逐文件多次调用正则
+                joined = "\n".join(meta.get("content", "") for meta in sources.values())
+                detected = _PRAGMA_VERSION_RE.findall(joined)
                 # 简单选择出现次数最多的版本
                 if detected:
-                    counts = {}
-                    for v in detected:
-                        counts[v] = counts.get(v, 0) + 1
-                    solc_version = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[0][0]
+                    solc_version = Counter(detected).most_common(1)[0][0]
 
             # 优先尝试使用 Foundry 扁平化（参考 verify_code.py 的实现）
             flattened_file = None
@@ -367,153 +630,62 @@ def analyze_contract(code, config):
                     
                     # 1. 将多文件源码复制到 foundry_dir 下（保持原目录结构）
                     # 参考 utils_download-main/verify_code.py 的 export_multifile 函数
-                    src_paths = []  # 记录所有源文件路径
-                    
-                    for rel_path, meta in sources.items():
-                        rel = rel_path.lstrip("./").strip()
-                        if not rel.endswith(".sol"):
-                            rel = rel + ".sol"
-                        abs_path = os.path.join(foundry_dir, rel)
-                        os.makedirs(os.path.dirname(abs_path), exist_ok=True)
-                        
-                        content = meta.get("content", "")
-                        with open(abs_path, "w", encoding="utf-8") as fw:
-                            fw.write(content.replace("\r\n", "\n"))
-                        src_paths.append(rel)
-                    
-                    # 2. 初始化 Foundry 项目（参考 utils_download-main/verify_code.py）
-                    print(f"[DEBUG] 初始化 Foundry 项目...", file=sys.stderr)
-                    init_result = subprocess.run(
-                        ["forge", "init", ".", "--force", "--no-git"],
-                        cwd=foundry_dir,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        timeout=30
-                    )
-                    if init_result.returncode != 0:
-                        print(f"[DEBUG] forge init 失败: {init_result.stderr}", file=sys.stderr)
-                        raise Exception("forge init failed")
-                    
-                    # 2.5. 删除 Forge 默认的示例文件（避免版本冲突）
-                    print(f"[DEBUG] 清理 Forge 默认文件...", file=sys.stderr)
-                    default_files_to_remove = [
-                        os.path.join(foundry_dir, "script", "Counter.s.sol"),
-                        os.path.join(foundry_dir, "src", "Counter.sol"),
-                        os.path.join(foundry_dir, "test", "Counter.t.sol"),
-                    ]
-                    for file_path in default_files_to_remove:
-                        if os.path.exists(file_path):
-                            try:
-                                os.remove(file_path)
-                            except Exception:
-                                pass
+                    src_paths = _write_sources(sources, foundry_dir)  # 记录所有源文件路径
                     
-                    # 3. 配置 foundry.toml（参考 verify_code.py 的实现）
+                    # 2. 直接写入最小化的 foundry.toml（无需 forge init 生成模板工程再清理示例文件）
                     toml_path = os.path.join(foundry_dir, "foundry.toml")
-                    if os.path.exists(toml_path):
-                        with open(toml_path, "r", encoding="utf-8") as f:
-                            lines = f.readlines()
-                        
-                        # 清理并重写配置
-                        new_lines = []
-                        remapping_flag = False
-                        for line in lines:
-                            # 跳过已有的 remappings 和注释
-                            if line.startswith('remappings =') and settings.get("remappings"):
-                                remapping_flag = True
-                                continue
-                            if remapping_flag:
-                                if line.strip().endswith(']'):
-                                    remapping_flag = False
-                                continue
-                            if line.startswith('# See more config options'):
-                                continue
-                            # 保留其他配置
-                            if line.strip() != '':
-                                new_lines.append(line)
-                        
-                        # 添加自定义配置（只使用 settings 中的 remappings）
-                        remappings = settings.get("remappings", [])
-                        if remappings:
-                            new_lines.append('remappings = [\n')
-                            # 添加用户定义的 remappings
-                            for r in remappings:
-                                new_lines.append(f'    "{r}",\n')
-                            new_lines.append(']\n')
-                        
-                        # 添加 Solidity 版本
-                        # 检查版本兼容性（Forge 不支持 0.9.0 等版本）
-                        if solc_version:
-                            # 解析版本号（处理可能的版本格式：0.8.1, ^0.8.1, >=0.8.1 等）
-                            version_str = solc_version.strip()
-                            # 移除版本前缀符号
-                            for prefix in ['^', '>=', '<=', '>', '<', '~', '=']:
-                                if version_str.startswith(prefix):
-                                    version_str = version_str[len(prefix):].strip()
-                            
-                            # 解析版本号
-                            try:
-                                version_parts = version_str.split('.')
-                                if len(version_parts) >= 2:
-                                    major = int(version_parts[0])
-                                    minor = int(version_parts[1])
-                                    # Forge 不支持 0.9.0，使用 0.8.x 的最新版本
-                                    if major == 0 and minor >= 9:
-                                        print(f"[DEBUG] Solidity {solc_version} 不被 Forge 支持，使用 0.8.26 替代", file=sys.stderr)
-                                        solc_version = "0.8.26"
-                            except (ValueError, IndexError):
-                                # 版本解析失败，使用原版本
-                                print(f"[DEBUG] 无法解析版本号 {solc_version}，使用原版本", file=sys.stderr)
-                            
-                            new_lines.append(f'solc_version = "{solc_version}"\n')
-                        
-                        # 添加优化配置
-                        via_ir = settings.get("viaIR", False)
-                        if via_ir:
-                            new_lines.append('via_ir = true\n')
-                            new_lines.append('optimizer = true\n')
-                            new_lines.append('optimizer_runs = 200\n')
+                    profile = {'src': '.', 'out': 'out', 'libs': ['lib']}
+
+                    # 添加自定义配置（只使用 settings 中的 remappings）
+                    remappings = settings.get("remappings", [])
+                    if remappings:
+                        profile['remappings'] = list(remappings)
+                    
+                    # 添加 Solidity 版本
+                    # 检查版本兼容性（Forge 不支持 0.9.0 等版本）
+                    if solc_version:
+                        # 解析版本号（处理可能的版本格式：0.8.1, ^0.8.1, >=0.8.1 等）
+                        version_str = solc_version.strip()
+                        # 移除版本前缀符号
+                        for prefix in ['^', '>=', '<=', '>', '<', '~', '=']:
+                            if version_str.startswith(prefix):
+                                version_str = version_str[len(prefix):].strip()
                         
-                        # 添加 EVM 版本
-                        evm_version = settings.get("evmVersion")
-                        if evm_version:
-                            new_lines.append(f'evm_version = "{evm_version}"\n')
+                        # 解析版本号
+                        try:
+                            version_parts = version_str.split('.')
+                            if len(version_parts) >= 2:
+                                major = int(version_parts[0])
+                                minor = int(version_parts[1])
+                                # Forge 不支持 0.9.0，使用 0.8.x 的最新版本
+                                if major == 0 and minor >= 9:
+                                    print(f"[DEBUG] Solidity {solc_version} 不被 Forge 支持，使用 0.8.26 替代", file=sys.stderr)
+                                    solc_version = "0.8.26"
+                        except (ValueError, IndexError):
+                            # 版本解析失败，使用原版本
+                            print(f"[DEBUG] 无法解析版本号 {solc_version}，使用原版本", file=sys.stderr)
                         
-                        with open(toml_path, "w", encoding="utf-8") as f:
-                            f.writelines(new_lines)
+                        profile['solc_version'] = solc_version
                     
-                    # 4. 编译合约（参考 verify_code.py，不使用 forge install）
-                    print(f"[DEBUG] 编译合约...", file=sys.stderr)
-                    build_result = subprocess.run(
-                        ["forge", "build"],
-                        cwd=foundry_dir,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        timeout=120
-                    )
+                    # 添加优化配置
+                    via_ir = settings.get("viaIR", False)
+                    if via_ir:
+                        profile.update(via_ir=True, optimizer=True, optimizer_runs=200)
                     
-                    if build_result.returncode != 0:
-                        print(f"[DEBUG] forge build 失败: {build_result.stderr}", file=sys.stderr)
-                        raise Exception("forge build failed")
-                    
-                    print(f"[DEBUG] 编译成功！", file=sys.stderr)
+                    # 添加 EVM 版本
+                    evm_version = settings.get("evmVersion")
+                    if evm_version:
+                        profile['evm_version'] = evm_version
+
+                    with open(toml_path, "w", encoding="utf-8") as f:
+                        f.write(_render_foundry_toml(profile))
                     
                     # 6. 选择主合约文件进行扁平化（排除依赖库，选择最大的用户合约）
                     candidates = []
                     
-                    # 扩展的依赖库排除列表
-                    excluded_patterns = [
-                        'node_modules/', 'lib/', '@openzeppelin/', '@chainlink/', 'forge-std/',
-                        'erc721a/', 'erc20/', 'erc1155/', 'erc777/',  # 常见的标准库
-                        'contracts/interfaces/', 'interfaces/',  # 接口文件夹
-                        '/test/', '/tests/', '/mock/', '/mocks/',  # 测试文件
-                    ]
-                    
                     for src_path in src_paths:
                         # 排除依赖库目录
-                        if any(excluded in src_path.lower() for excluded in excluded_patterns):
+                        if _EXCLUDED_SOURCE_RE.search(src_path):
                             print(f"[DEBUG] 排除依赖/测试文件: {src_path}", file=sys.stderr)
                             continue
                         
@@ -556,61 +728,52 @@ def analyze_contract(code, config):
                     
                     print(f"[DEBUG] 执行 forge flatten...", file=sys.stderr)
 
-                    flatten_result = subprocess.run(
-                        ["forge", "flatten", main_contract_path],
-                        cwd=foundry_dir,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        timeout=60
-                    )
-
-                    if flatten_result.returncode == 0 and flatten_result.stdout and flatten_result.stdout.strip():
-                        flattened_lines_raw = flatten_result.stdout.splitlines()
-                        flattened_lines_raw = [
-                            line for line in flattened_lines_raw
-                            if "SPDX-License-Identifier" not in line and "pragma solidity" not in line
-                        ]
-                        flattened_content = "\n".join([
-                            "// SPDX-License-Identifier: MIT",
-                            f"pragma solidity ^{pragma_version};",
-                            *flattened_lines_raw,
-                            ""
-                        ])
-
-                        with open(flattened_file, "w", encoding="utf-8") as f:
-                            f.write(flattened_content)
-                        
-                        if len(flattened_content.strip()) > 100:  # 确保文件有实质内容
-                            # 根据用户要求，删除所有注释和文档标签
-                            print(f"[DEBUG] 正在删除所有注释...", file=sys.stderr)
+                    # forge flatten 的输出直接写入文件，不在内存中缓冲
+                    with open(flattened_file, "w", encoding="utf-8") as flattened_fp:
+                        flatten_result = subprocess.run(
+                            ["forge", "flatten", main_contract_path],
+                            cwd=foundry_dir,
+                            stdout=flattened_fp,
+                            stderr=subprocess.PIPE,
+                            text=True,
+                            timeout=60
+                        )
 
-                            lines = flattened_content.split('\n')
-                            
-                            # 前两行是 sed 添加的 SPDX 和 pragma，保留它们
-                            header_lines = lines[:2]
-                            content_to_clean = '\n'.join(lines[2:])
+                    flattened_raw = ""
+                    if flatten_result.returncode == 0:
+                        with open(flattened_file, "r", encoding="utf-8") as f:
+                            flattened_raw = f.read()
 
-                            # 1. 删除多行注释 /* ... */
-                            no_multiline_comments = re.sub(r'/\*[\s\S]*?\*/', '', content_to_clean, flags=re.MULTILINE)
-                            
-                            # 2. 删除单行注释 // ...
-                            no_single_line_comments = re.sub(r'//.*', '', no_multiline_comments)
-                            
-                            # 3. 移除因删除注释而产生的多余空行
-                            cleaned_lines = [line for line in no_single_line_comments.split('\n') if line.strip() != '']
-                            
-                            # 重新组合文件内容
-                            final_lines = header_lines + cleaned_lines
-                            flattened_content = '\n'.join(final_lines)
+                    if flattened_raw.strip():
+                        # 根据用户要求，删除所有注释和文档标签
+                        print(f"[DEBUG] 正在删除所有注释...", file=sys.stderr)
+
+                        # 1. 单遍删除多行注释 /* ... */ 和单行注释 // ...
+                        no_comments = _strip_solidity_comments(flattened_raw)
+
+                        # 2. 移除原有的 SPDX/pragma 以及因删除注释而产生的多余空行（生成器直接拼接，不保留中间列表）
+                        body = '\n'.join(
+                            line for line in no_comments.split('\n')
+                            if line.strip()
+                            and "SPDX-License-Identifier" not in line
+                            and "pragma solidity" not in line
+                        )
+
+                        if body:  # 确保文件有实质内容
+                            # 统一的 SPDX 和 pragma 头部
+                            flattened_content = (
+                                "// SPDX-License-Identifier: MIT\n"
+                                f"pragma solidity ^{pragma_version};\n"
+                                f"{body}\n"
+                            )
                             flattened_content = remove_duplicate_interfaces(flattened_content)
 
                             print(f"[DEBUG] 所有注释已删除。", file=sys.stderr)
-                            
+
                             # 写回清理后的内容
                             with open(flattened_file, "w", encoding="utf-8") as f:
                                 f.write(flattened_content)
-                            
+
                             # 将扁平化文件保存到项目目录的 flattened_contracts/ 文件夹
                             try:
                                 # os.getcwd() 对于从Go调用时的路径可能不准确
@@ -634,7 +797,11 @@ def analyze_contract(code, config):
                                     target_filename = f"{base_name}_{timestamp}.sol"
                                     final_path = os.path.join(output_dir, target_filename)
                                 
-                                shutil.copyfile(flattened_file, final_path)
+                                # 同一文件系统上用硬链接代替复制（foundry_dir 清理后硬链接依然有效）
+                                try:
+                                    os.link(flattened_file, final_path)
+                                except OSError:
+                                    shutil.copyfile(flattened_file, final_path)
                                 print(f"[DEBUG] 扁平化文件已保存到: {final_path}", file=sys.stderr)
                             except Exception as e:
                                 print(f"[DEBUG] 保存扁平化文件失败: {e}", file=sys.stderr)
@@ -669,7 +836,7 @@ def analyze_contract(code, config):
                         "success": False,
                         "error": "Forge flatten timeout. 合约结构过于复杂，无法扁平化。"
                     }
-                    print(json.dumps(result))
+                    _write_json(result)
                     sys.exit(1)
                 except Exception as forge_err:
                     error_msg = str(forge_err)
@@ -681,7 +848,7 @@ def analyze_contract(code, config):
                         "success": False,
                         "error": f"Forge flatten failed: {error_msg}"
                     }
-                    print(json.dumps(result))
+                    _write_json(result)
                     sys.exit(1)
             else:
                 # 未检测到 forge，无法处理多文件合约
@@ -690,7 +857,7 @@ def analyze_contract(code, config):
                     "success": False,
                     "error": "Forge not found. Cannot process multi-file contracts without Forge."
                 }
-                print(json.dumps(result))
+                _write_json(result)
                 sys.exit(1)
         else:
             # 单文件：落盘到临时文件
@@ -699,6 +866,22 @@ def analyze_contract(code, config):
                 temp_file = f.name
             target_path = temp_file
 
+        # 编译配置
+        solc_args = ""
+        if config.get('optimization'):
+            solc_args += "--optimize "
+        if config.get('via_ir'):
+            solc_args += "--via-ir "
+        solc_args = solc_args.strip()
+
+        # 相同源码 + 编译参数 + Slither 版本的分析结果直接复用缓存
+        cache_path = _result_cache_path(target_path, solc_version, solc_args)
+        if cache_path:
+            cached = _load_cached_result(cache_path)
+            if cached is not None:
+                print(f"[DEBUG] 命中分析结果缓存: {cache_path}", file=sys.stderr)
+                return cached
+
         # 解析/安装 solc 路径
         solc_path = None
         if solc_version:
@@ -714,15 +897,12 @@ def analyze_contract(code, config):
                 print(f"Warning: Error getting solc path for {solc_version}: {e}, will try auto-detection", file=sys.stderr)
                 solc_path = None
         
-        # 编译配置
-        solc_args = ""
-        if config.get('optimization'):
-            solc_args += "--optimize "
-        if config.get('via_ir'):
-            solc_args += "--via-ir "
-        solc_args = solc_args.strip()
-        
-        # 使用 CryticCompile 编译（支持目录或单文件；若已扁平化，则 target_path 为单文件）
+        # solc-select 的 solc 包装器通过 SOLC_VERSION 选择版本
+        # （只影响本进程及其子进程，CryticCompile/slither 调用 solc 时会继承）
+        if solc_version:
+            os.environ['SOLC_VERSION'] = solc_version
+
+        # 使用 CryticCompile 编译（target_path 总是单文件：扁平化结果或单文件源码）
         try:
             if solc_path:
                 crytic_compile = CryticCompile(
@@ -739,35 +919,17 @@ def analyze_contract(code, config):
 
             slither = Slither(crytic_compile)
         except Exception as cc_err:
-            # 回退逻辑：若目标是目录，收集所有 .sol 文件再交给 Slither
+            crytic_compile = None
+            # 回退逻辑：直接交给 Slither 编译单文件
             print(f"Warning: CryticCompile failed, fallback to raw Slither: {cc_err}", file=sys.stderr)
-            if os.path.isdir(target_path):
-                # 选择一个可能的主文件（最大体积）
-                sol_files = []
-                for root, _, files in os.walk(target_path):
-                    for name in files:
-                        if name.endswith(".sol"):
-                            fp = os.path.join(root, name)
-                            try:
-                                size = os.path.getsize(fp)
-                            except Exception:
-                                size = 0
-                            sol_files.append((size, fp))
-                if not sol_files:
-                    raise Exception(f"Invalid compilation: {target_path} is a directory with no .sol files")
-                sol_files.sort(reverse=True)
-                main_file = sol_files[0][1]
-                if solc_path:
-                    slither = Slither(main_file, solc=solc_path)
-                else:
-                    slither = Slither(main_file)
+            if solc_path:
+                slither = Slither(target_path, solc=solc_path)
             else:
-                # 单文件回退
-                if solc_path:
-                    slither = Slither(target_path, solc=solc_path)
-                else:
-                    slither = Slither(target_path)
+                slither = Slither(target_path)
         
+        # 至少有一条检测路径完整跑完才缓存结果，避免把检测失败缓存成“无发现”
+        detection_ok = False
+
         # 提取信息
         result = {
             'state_variables': [],
@@ -781,54 +943,55 @@ def analyze_contract(code, config):
             main_contract = contracts[0]
             
             # 提取状态变量
-            for var in main_contract.state_variables:
-                result['state_variables'].append({
+            result['state_variables'] = [
+                {
                     'name': var.name,
                     'type': str(var.type),
                     'visibility': var.visibility,
                     'is_constant': var.is_constant
-                })
-            
+                }
+                for var in main_contract.state_variables
+            ]
+
             # 提取函数
-            for func in main_contract.functions:
-                if func.is_constructor or func.is_fallback or func.is_receive:
-                    continue
-                
-                # 获取参数类型
-                params = []
-                if func.parameters:
-                    params = [str(p.type) for p in func.parameters]
-                
-                # 获取返回类型
-                returns = []
-                if func.returns:
-                    returns = [str(r.type) for r in func.returns]
-                
-                # 获取 state_mutability（旧版本可能没有这个属性）
-                state_mutability = 'nonpayable'  # 默认值
-                if hasattr(func, 'state_mutability'):
-                    state_mutability = func.state_mutability
-                elif hasattr(func, 'payable'):
-                    # 旧版本使用 payable 属性
-                    state_mutability = 'payable' if func.payable else 'nonpayable'
-                
-                result['functions'].append({
+            functions = main_contract.functions
+            # 同一合约的函数对象类型一致，属性是否存在（新旧版本差异）只需判断一次
+            sample = functions[0] if functions else None
+            has_state_mutability = hasattr(sample, 'state_mutability')
+            # 旧版本使用 payable 属性
+            has_payable = hasattr(sample, 'payable')
+            has_signature_str = hasattr(sample, 'signature_str')
+
+            def _state_mutability(func):
+                if has_state_mutability:
+                    return func.state_mutability
+                if has_payable:
+                    return 'payable' if func.payable else 'nonpayable'
+                return 'nonpayable'  # 默认值
+
+            result['functions'] = [
+                {
                     'name': func.name,
-                    'signature': func.signature_str if hasattr(func, 'signature_str') else func.name,
+                    'signature': func.signature_str if has_signature_str else func.name,
                     'visibility': func.visibility,
-                    'state_mutability': state_mutability,
-                    'parameters': params,
-                    'returns': returns
-                })
-            
+                    'state_mutability': _state_mutability(func),
+                    'parameters': [str(p.type) for p in func.parameters or ()],
+                    'returns': [str(r.type) for r in func.returns or ()]
+                }
+                for func in functions
+                if not (func.is_constructor or func.is_fallback or func.is_receive)
+            ]
+
             # 运行检测器并获取结果
             try:
                 # 运行检测器
                 slither.run_detectors()
                 
                 # 方法1: 使用 Slither 的 detectors 属性（如果可用）
-                if hasattr(slither, 'detectors') and slither.detectors:
-                    for detector in slither.detectors:
+                # run_detectors() 已经运行过这些注册的检测器实例，直接读取其结果
+                registered_detectors = getattr(slither, '_detectors', None) or getattr(slither, 'detectors', None)
+                if registered_detectors:
+                    for detector in registered_detectors:
                         if hasattr(detector, 'results') and detector.results:
                             for finding in detector.results:
                                 # 获取检测器名称
@@ -842,166 +1005,60 @@ def analyze_contract(code, config):
                                 impact = 'Unknown'
                                 confidence = 'Unknown'
                                 if hasattr(finding, 'impact'):
-                                    impact = str(finding.impact)
+                                    impact = _classification_text(finding.impact)
                                 if hasattr(finding, 'confidence'):
-                                    confidence = str(finding.confidence)
+                                    confidence = _classification_text(finding.confidence)
                                 
                                 # 过滤低风险漏洞 (Low/Informational)
-                                if impact.lower() in ['low', 'informational', 'optimization']:
+                                if impact.lower() in _LOW_IMPACTS:
                                     continue
                                 
-                                # 提取行号
-                                line_numbers = []
-                                if hasattr(finding, 'elements'):
-                                    for element in finding.elements:
-                                        if hasattr(element, 'source_mapping'):
-                                            source_mapping = element.source_mapping
-                                            if source_mapping and 'lines' in source_mapping:
-                                                line_numbers.extend(source_mapping['lines'])
-                                
-                                # 去重并排序行号
-                                line_numbers = sorted(list(set(line_numbers)))
-
                                 result['detectors'].append({
                                     'check': check_name,
                                     'impact': impact,
                                     'confidence': confidence,
                                     'description': str(finding),
-                                    'line_numbers': line_numbers
+                                    'line_numbers': _finding_line_numbers(finding)
                                 })
+                    detection_ok = True
                 
-                # 方法2: 手动运行所有检测器（如果 detectors 属性为空）
-                if len(result['detectors']) == 0:
+                # 方法2: 注册所有检测器后逐个运行（仅当没有已注册的检测器时；
+                # 已注册的检测器在方法1中读过结果，不再重新运行一遍）
+                if not registered_detectors and len(result['detectors']) == 0:
                     try:
-                        # 导入检测器模块
-                        import slither.detectors as detectors_module
-                        import inspect
-                        
-                        # 获取所有检测器类
-                        detector_classes = []
-                        for name in dir(detectors_module):
-                            obj = getattr(detectors_module, name)
-                            # 检查是否是检测器类
-                            if (inspect.isclass(obj) and 
-                                hasattr(obj, 'detect') and 
-                                hasattr(obj, 'ARGUMENT')):
-                                detector_classes.append(obj)
-                        
-                        # 如果上面没找到，尝试从子模块导入
-                        if not detector_classes:
-                            # 尝试导入常见的检测器模块
-                            detector_modules = [
-                                'slither.detectors.reentrancy',
-                                'slither.detectors.unchecked_transfer',
-                                'slither.detectors.uninitialized_state',
-                                'slither.detectors.uninitialized_storage',
-                                'slither.detectors.arbitrary_send',
-                                'slither.detectors.deprecated_standards',
-                                'slither.detectors.erc20_indexed',
-                                'slither.detectors.incorrect_erc20_interface',
-                                'slither.detectors.locked_ether',
-                                'slither.detectors.missing_events',
-                                'slither.detectors.naming_convention',
-                                'slither.detectors.controlled_delegatecall',
-                                'slither.detectors.functions_that_send_ether',
-                                'slither.detectors.suicidal',
-                                'slither.detectors.uninitialized_storage_pointer',
-                                'slither.detectors.unused_state_variable',
-                                'slither.detectors.timestamp',
-                                'slither.detectors.assembly',
-                                'slither.detectors.bad_prng',
-                                'slither.detectors.boolean_constant',
-                                'slither.detectors.constant_pragma',
-                                'slither.detectors.deprecated_standards',
-                                'slither.detectors.erc20_indexed',
-                                'slither.detectors.incorrect_erc20_interface',
-                                'slither.detectors.locked_ether',
-                                'slither.detectors.missing_events',
-                                'slither.detectors.naming_convention',
-                                'slither.detectors.controlled_delegatecall',
-                                'slither.detectors.functions_that_send_ether',
-                                'slither.detectors.suicidal',
-                                'slither.detectors.uninitialized_storage_pointer',
-                                'slither.detectors.unused_state_variable',
-                            ]
-                            
-                            for mod_name in detector_modules:
-                                try:
-                                    mod = __import__(mod_name, fromlist=[''])
-                                    for name in dir(mod):
-                                        obj = getattr(mod, name)
-                                        if (inspect.isclass(obj) and 
-                                            hasattr(obj, 'detect') and 
-                                            hasattr(obj, 'ARGUMENT')):
-                                            detector_classes.append(obj)
-                                except Exception:
-                                    pass
-                        
-                        # 遍历所有检测器类并运行
-                        for detector_class in detector_classes:
+                        for detector_class in _detector_classes():
                             try:
-                                # 实例化检测器
-                                detector = detector_class(slither, None)
-                                # 运行检测
-                                detector.detect()
-                                
-                                # 获取结果
-                                if hasattr(detector, 'results') and detector.results:
-                                    # 获取检测器名称
-                                    check_name = 'unknown'
-                                    if hasattr(detector, 'ARGUMENT'):
-                                        check_name = detector.ARGUMENT
-                                    elif hasattr(detector_class, '__name__'):
-                                        check_name = detector_class.__name__.replace('Detector', '').lower()
-                                    
-                                    # 处理每个检测结果
-                                    for finding in detector.results:
-                                        # 提取影响和置信度
-                                        impact = 'Unknown'
-                                        confidence = 'Unknown'
-                                        if hasattr(finding, 'impact'):
-                                            impact = str(finding.impact)
-                                        if hasattr(finding, 'confidence'):
-                                            confidence = str(finding.confidence)
-                                        
-                                        # 过滤低风险漏洞 (Low/Informational)
-                                        if impact.lower() in ['low', 'informational', 'optimization']:
-                                            continue
-
-                                        # 提取行号
-                                        line_numbers = []
-                                        if hasattr(finding, 'elements'):
-                                            for element in finding.elements:
-                                                if hasattr(element, 'source_mapping'):
-                                                    source_mapping = element.source_mapping
-                                                    if source_mapping and 'lines' in source_mapping:
-                                                        line_numbers.extend(source_mapping['lines'])
-                                        
-                                        line_numbers = sorted(list(set(line_numbers)))
-
-                                        result['detectors'].append({
-                                            'check': check_name,
-                                            'impact': impact,
-                                            'confidence': confidence,
-                                            'description': str(finding),
-                                            'line_numbers': line_numbers
-                                        })
+                                slither.register_detector(detector_class)
                             except Exception:
-                                # 单个检测器失败不影响其他检测器
+                                # 个别检测器无法注册不影响其他检测器
                                 pass
+
+                        # 不用 run_detectors()：它一次性运行全部检测器，任一检测器异常会丢掉所有结果
+                        for detector in slither.detectors:
+                            try:
+                                detector_results = detector.detect()
+                            except Exception as det_err:
+                                # 单个检测器失败不影响其他检测器
+                                print(f"[DEBUG] 检测器 {getattr(detector, 'ARGUMENT', type(detector).__name__)} 运行失败: {det_err}", file=sys.stderr)
+                                continue
+                            result['detectors'].extend(_detector_result_findings(detector_results))
+                            detection_ok = True
                     except Exception as import_err:
-                        print(f"Warning: Could not import detectors: {import_err}", file=sys.stderr)
+                        print(f"Warning: Could not run detectors: {import_err}", file=sys.stderr)
                         import traceback
                         print(f"Traceback: {traceback.format_exc()}", file=sys.stderr)
                 
-                # 方法3: 如果 Python API 没有返回结果，使用命令行工具作为回退
-                if len(result['detectors']) == 0:
+                # 方法3: 仅当 Python API 没有完整跑完检测时，使用命令行工具作为回退
+                # （检测已完成但结果为空，表示没有需要上报的问题，不再重跑一遍）
+                if not detection_ok:
                     try:
-                        print(f"[DEBUG] Python API 未返回检测结果，尝试使用命令行工具...", file=sys.stderr)
+                        print(f"[DEBUG] Python API 未能完成检测，尝试使用命令行工具...", file=sys.stderr)
                         # 使用 slither 命令行工具获取 JSON 输出
-                        slither_cmd = ['slither', target_path, '--json', '-']
+                        # 已有编译归档时直接分析归档，命令行工具无需再调用 solc
+                        archive_path = _compilation_archive()
+                        slither_cmd = ['slither', archive_path or target_path, '--json', '-']
                         # 注意：slither 命令行工具使用 --solc 参数指定编译器版本
-                        if solc_version:
+                        if solc_version and not archive_path:
                             # 先尝试获取 solc 路径
                             solc_path_for_cmd = get_solc_path(solc_version)
                             if solc_path_for_cmd and os.path.exists(solc_path_for_cmd):
@@ -1014,48 +1071,29 @@ def analyze_contract(code, config):
                             slither_cmd,
                             stdout=subprocess.PIPE,
                             stderr=subprocess.PIPE,
-                            text=True,
                             timeout=120
                         )
                         
                         # Slither 即使检测到问题也可能返回非零退出码，但 JSON 输出仍然有效
                         # 检查 stdout 是否包含有效的 JSON
-                        if slither_result.stdout and slither_result.stdout.strip().startswith('{'):
+                        # （stdout 保持 bytes，只看首字节，不对整个输出做 strip 拷贝）
+                        if slither_result.stdout[:1] == b'{':
                             # 解析 JSON 输出
                             try:
-                                slither_json = json.loads(slither_result.stdout)
-                                detectors_data = slither_json.get('results', {}).get('detectors', [])
-                                
-                                for detector_data in detectors_data:
-                                    impact = detector_data.get('impact', 'Unknown')
-                                    
-                                    # 过滤低风险漏洞 (Low/Informational)
-                                    if impact.lower() in ['low', 'informational', 'optimization']:
-                                        continue
-                                        
-                                    # 提取行号 (从 elements 中)
-                                    line_numbers = []
-                                    elements = detector_data.get('elements', [])
-                                    for element in elements:
-                                        source_mapping = element.get('source_mapping', {})
-                                        lines = source_mapping.get('lines', [])
-                                        line_numbers.extend(lines)
-                                    
-                                    line_numbers = sorted(list(set(line_numbers)))
-                                    
-                                    result['detectors'].append({
-                                        'check': detector_data.get('check', 'unknown'),
-                                        'impact': impact,
-                                        'confidence': detector_data.get('confidence', 'Unknown'),
-                                        'description': detector_data.get('description', ''),
-                                        'line_numbers': line_numbers
-                                    })
-                                
-                                print(f"[DEBUG] 从命令行工具获取到 {len(detectors_data)} 个检测结果", file=sys.stderr)
+                                slither_json = _json_loads(slither_result.stdout)
+                                # 失败时 --json 也会输出 {"success": false, "error": ...}，不能当作“无发现”
+                                if slither_json.get('success'):
+                                    detectors_data = slither_json.get('results', {}).get('detectors', [])
+                                    result['detectors'].extend(_detector_result_findings(detectors_data))
+                                    detection_ok = True
+
+                                    print(f"[DEBUG] 从命令行工具获取到 {len(detectors_data)} 个检测结果", file=sys.stderr)
+                                else:
+                                    print(f"[DEBUG] Slither 命令行工具执行失败: {slither_json.get('error')}", file=sys.stderr)
                             except json.JSONDecodeError as json_err:
                                 print(f"[DEBUG] 解析 Slither JSON 输出失败: {json_err}", file=sys.stderr)
                         else:
-                            print(f"[DEBUG] Slither 命令行工具执行失败: {slither_result.stderr}", file=sys.stderr)
+                            print(f"[DEBUG] Slither 命令行工具执行失败: {slither_result.stderr.decode(errors='replace')}", file=sys.stderr)
                     except Exception as cmd_err:
                         print(f"[DEBUG] 使用命令行工具回退失败: {cmd_err}", file=sys.stderr)
                         
@@ -1064,32 +1102,21 @@ def analyze_contract(code, config):
                 print(f"Warning: Detector execution failed: {e}", file=sys.stderr)
                 import traceback
                 print(f"Traceback: {traceback.format_exc()}", file=sys.stderr)
-        
+
+        if cache_path and detection_ok:
+            _store_cached_result(cache_path, result)
+
         return result
 
     except Exception as e:
         error_msg = str(e)
         
         # 检测常见的旧版本语法问题，提供友好的错误信息
-        if "constructor()" in error_msg and "Expected identifier" in error_msg:
-            error_msg += (
-                "\n提示: Solidity 0.4.x 不支持 constructor() 语法。"
-                "0.4.x 使用与合约同名的函数作为构造函数。"
-                "这可能是合约代码本身的问题，而不是工具问题。"
-            )
-        elif "emit" in error_msg and "Expected token Semicolon" in error_msg:
-            error_msg += (
-                "\n提示: emit 关键字在 Solidity 0.4.21 之前不存在。"
-                "这可能是合约代码本身的问题，而不是工具问题。"
-            )
-        elif "Invalid compilation" in error_msg:
-            # 提取版本信息
-            version = config.get('solc_version', 'unknown')
-            error_msg += (
-                f"\n提示: 合约代码可能包含与 Solidity {version} 不兼容的语法。"
-                "这可能是合约代码本身的问题，而不是工具问题。"
-            )
-        
+        for pattern, hint in _DIAG_RULES:
+            if pattern.match(error_msg):
+                error_msg += hint.format(version=config.get('solc_version', 'unknown'))
+                break
+
         raise Exception(f"Slither analysis failed: {error_msg}")
     finally:
         _cleanup()
@@ -1098,33 +1125,33 @@ def analyze_contract(code, config):
 if __name__ == '__main__':
     # 从stdin读取JSON输入
     try:
-        input_data = json.loads(sys.stdin.read())
-    except json.JSONDecodeError as e:
-        print(json.dumps({
+        input_data = _json_loads(sys.stdin.buffer.read())
+    except ValueError as e:  # JSONDecodeError 与非法 UTF-8 输入
+        _write_json({
             'success': False,
             'error': f'Invalid JSON input: {str(e)}'
-        }))
+        })
         sys.exit(1)
     
     code = input_data.get('code', '')
     if not code:
-        print(json.dumps({
+        _write_json({
             'success': False,
             'error': 'No code provided'
-        }))
+        })
         sys.exit(1)
     
     config = input_data.get('config', {})
     
     try:
         result = analyze_contract(code, config)
-        print(json.dumps({
+        _write_json({
             'success': True,
             'result': result
-        }, indent=2))
+        })
     except Exception as e:
-        print(json.dumps({
+        _write_json({
             'success': False,
             'error': str(e)
-        }))
+        })
         sys.exit(1)